@@ -117,5 +117,6 @@ setup(
         ],
         "bioinformatics": ["biopython>=1.73, <2.0"],
         "matplotlib": ["matplotlib>=3.0.3, <4.0"],
+        "zstd": ["zstandard>=0.15.0, <1.0"],
     },
 )
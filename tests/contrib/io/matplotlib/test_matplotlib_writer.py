@@ -26,6 +26,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from io import BytesIO
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -45,15 +46,15 @@ class TestMatplotlibWriter:
         plt.plot(np.random.rand(1, 5)[0], np.random.rand(1, 5)[0])
 
         # write and compare
-        actual_filepath = tmp_path / "image_we_expect.png"
-        plt.savefig(str(actual_filepath))
+        actual_image = BytesIO()
+        plt.savefig(actual_image, format="png")
 
         expected_filepath = tmp_path / "image_we_write.png"
         plot_writer = MatplotlibWriter(filepath=str(expected_filepath))
         plot_writer.save(plt)
         plt.close()
 
-        assert actual_filepath.read_bytes() == expected_filepath.read_bytes()
+        assert actual_image.getvalue() == expected_filepath.read_bytes()
 
     def test_save_list_images(self, tmp_path):
         # generate plots
@@ -71,11 +72,11 @@ class TestMatplotlibWriter:
 
         # write and compare
         for index, plot in enumerate(plots):
-            actual_filepath = tmp_path / "image_we_expect_{}.png".format(str(index))
-            plot.savefig(str(actual_filepath))
+            actual_image = BytesIO()
+            plot.savefig(actual_image, format="png")
 
             full_expected_filepath = expected_filepath / "{}.png".format(str(index))
-            assert actual_filepath.read_bytes() == full_expected_filepath.read_bytes()
+            assert actual_image.getvalue() == full_expected_filepath.read_bytes()
 
     def test_save_dict_images(self, tmp_path):
         plots = dict()
@@ -92,13 +93,11 @@ class TestMatplotlibWriter:
 
         # write and compare
         for filename, plot in plots.items():
-            actual_filepath = (
-                tmp_path / "dict_images" / filename.replace(".png", "_actual.png")
-            )
-            plot.savefig(str(actual_filepath))
+            actual_image = BytesIO()
+            plot.savefig(actual_image, format="png")
             expected_filepath = tmp_path / "dict_images" / filename
 
-            assert actual_filepath.read_bytes() == expected_filepath.read_bytes()
+            assert actual_image.getvalue() == expected_filepath.read_bytes()
 
     def test_load_fail(self, tmp_path):
         plot_writer = MatplotlibWriter(filepath=str(tmp_path / "some_path"))
@@ -28,13 +28,21 @@
 
 # pylint: disable=no-member
 
+import gc
 import pickle
+import sys
+from collections import OrderedDict
 from multiprocessing.reduction import ForkingPickler
+from pathlib import PurePosixPath
+from pickletools import genops
 
+import numpy as np
+import pandas as pd
 import pytest
 import s3fs
-from botocore.exceptions import PartialCredentialsError
+from botocore.exceptions import ClientError, PartialCredentialsError
 from moto import mock_s3
+from pandas.util.testing import assert_frame_equal
 from s3fs import S3FileSystem
 
 from kedro.io import DataSetError, PickleS3DataSet, Version
@@ -45,6 +53,7 @@ AWS_CREDENTIALS = dict(
     aws_access_key_id="FAKE_ACCESS_KEY", aws_secret_access_key="FAKE_SECRET_KEY"
 )
 DUMMY_PICKABLE_OBJECT = {"key": "value"}
+ZSTD_MAGIC_NUMBER = b"\x28\xb5\x2f\xfd"
 
 
 @pytest.fixture
@@ -65,6 +74,16 @@ def s3_data_set_with_args():
     )
 
 
+@pytest.fixture
+def compressed_s3_data_set():
+    return PickleS3DataSet(
+        filepath=FILENAME,
+        bucket_name=BUCKET_NAME,
+        credentials=AWS_CREDENTIALS,
+        compression="zstd",
+    )
+
+
 @pytest.fixture
 def versioned_s3_data_set(load_version, save_version):
     return PickleS3DataSet(
@@ -121,18 +140,59 @@ class TestPickleS3DataSet:
         s3_data_set.save(DUMMY_PICKABLE_OBJECT)
         assert s3_data_set.exists()
 
+    @pytest.mark.usefixtures("mocked_s3_bucket")
+    def test_exists_error(self, s3_data_set, mocker):
+        """Test that errors other than a missing object are not swallowed
+        by `exists`."""
+        error = ClientError({"Error": {"Code": "403"}}, "HeadObject")
+        s3_client = s3_data_set._s3.s3  # pylint: disable=protected-access
+        mocker.patch.object(s3_client, "head_object", side_effect=error, autospec=True)
+        pattern = r"Failed during exists check for data set PickleS3DataSet\(.+\)"
+        with pytest.raises(DataSetError, match=pattern) as exc_info:
+            s3_data_set.exists()
+        assert exc_info.value.__cause__ is error
+
+    @pytest.mark.usefixtures("mocked_s3_object")
+    def test_exists_additional_kwargs(self, s3_data_set, mocker):
+        """Test that `exists` sends the additional S3 arguments of the
+        file system, like loads and saves do."""
+        s3 = s3_data_set._s3  # pylint: disable=protected-access
+        mocker.patch.object(s3, "s3_additional_kwargs", {"RequestPayer": "requester"})
+        head_object = mocker.spy(s3.s3, "head_object")
+        assert s3_data_set.exists()
+        head_object.assert_called_once_with(
+            Bucket=BUCKET_NAME, Key=FILENAME, RequestPayer="requester"
+        )
+
     @pytest.mark.usefixtures("mocked_s3_object")
     def test_load(self, s3_data_set):
         """Test loading the data from S3."""
         loaded_data = s3_data_set.load()
         assert loaded_data == DUMMY_PICKABLE_OBJECT
 
+    def test_load_unframed(self, s3_data_set, mocked_s3_bucket):
+        """Test loading an object pickled without frames, as done by
+        protocol 3 and below."""
+        data = OrderedDict(key="value")
+        mocked_s3_bucket.put_object(
+            Bucket=BUCKET_NAME, Key=FILENAME, Body=pickle.dumps(data, protocol=2)
+        )
+        assert s3_data_set.load() == data
+
     @pytest.mark.usefixtures("mocked_s3_object")
     def test_load_args(self, s3_data_set_with_args):
         """Test loading the data from S3 with options."""
         loaded_data = s3_data_set_with_args.load()
         assert loaded_data == DUMMY_PICKABLE_OBJECT
 
+    @pytest.mark.usefixtures("mocked_s3_object")
+    def test_load_restores_gc(self, s3_data_set, mocker):
+        """Test that the garbage collector is disabled while unpickling
+        and re-enabled afterwards."""
+        mocker.patch("pickle.load", side_effect=lambda *_, **__: gc.isenabled())
+        assert s3_data_set.load() is False
+        assert gc.isenabled()
+
     @pytest.mark.parametrize(
         "bad_credentials",
         [{"aws_secret_access_key": "SECRET"}, {"aws_access_key_id": "KEY"}],
@@ -183,6 +243,27 @@ class TestPickleS3DataSet:
         for k, v in AWS_CREDENTIALS.items():
             assert kwargs[k] == v
 
+    @pytest.mark.parametrize(
+        "filepath", [FILENAME, "/" + FILENAME, PurePosixPath(FILENAME)]
+    )
+    def test_filepath(self, filepath):
+        """Test that the file path is resolved relative to the bucket."""
+        data_set = PickleS3DataSet(filepath=filepath, bucket_name=BUCKET_NAME)
+        filepath = str(data_set._filepath)  # pylint: disable=protected-access
+        assert filepath == "{}/{}".format(BUCKET_NAME, FILENAME)
+
+    def test_s3fs_instance_reused(self, mocker):
+        """Test that data sets with the same credentials share an
+        ``S3FileSystem`` instance and therefore its boto3 client."""
+        mocker.patch.object(S3FileSystem, "cachable", True)
+        data_set = PickleS3DataSet(
+            filepath=FILENAME, bucket_name=BUCKET_NAME, credentials=AWS_CREDENTIALS
+        )
+        other_data_set = PickleS3DataSet(
+            filepath="other.pkl", bucket_name=BUCKET_NAME, credentials=AWS_CREDENTIALS
+        )
+        assert data_set._s3 is other_data_set._s3  # pylint: disable=protected-access
+
     @pytest.mark.usefixtures("mocked_s3_object")
     def test_save(self, s3_data_set):
         """Test saving the data to S3."""
@@ -199,6 +280,206 @@ class TestPickleS3DataSet:
         loaded_data = s3_data_set_with_args.load()
         assert loaded_data == new_data
 
+    @pytest.mark.parametrize(
+        "unpicklable", [lambda: None, [b"0" * 6 * 2 ** 20, lambda: None]]
+    )
+    @pytest.mark.parametrize("data_set", ["s3_data_set", "compressed_s3_data_set"])
+    def test_save_unpicklable(
+        self, request, data_set, mocked_s3_bucket, unpicklable, mocker
+    ):
+        """Test that a failed save does not upload the buffered data nor
+        leave a partial object or a pending multipart upload on S3."""
+        data_set = request.getfixturevalue(data_set)
+        upload_chunk = mocker.spy(s3fs.core.S3File, "_upload_chunk")
+        pattern = r"Failed while saving data to data set PickleS3DataSet\(.+\)"
+        with pytest.raises(DataSetError, match=pattern):
+            data_set.save(unpicklable)
+        assert not data_set.exists()
+        uploads = mocked_s3_bucket.list_multipart_uploads(Bucket=BUCKET_NAME)
+        assert not uploads.get("Uploads")
+        assert not any(call[1].get("final") for call in upload_chunk.call_args_list)
+
+    def test_save_fast(self, mocked_s3_bucket):
+        """Test that no objects are memoized when saving in fast mode."""
+        data_set = PickleS3DataSet(
+            filepath=FILENAME,
+            bucket_name=BUCKET_NAME,
+            credentials=AWS_CREDENTIALS,
+            save_args={"fast": True},
+        )
+        data = [{"key": index} for index in range(10)]
+        data_set.save(data)
+        body = mocked_s3_bucket.get_object(Bucket=BUCKET_NAME, Key=FILENAME)[
+            "Body"
+        ].read()
+        assert "MEMOIZE" not in {opcode.name for opcode, _, _ in genops(body)}
+        assert data_set.load() == data
+
+    @pytest.mark.usefixtures("mocked_s3_bucket")
+    def test_save_and_load_numpy(self, s3_data_set):
+        """Test saving and reloading numpy-backed objects, which use their
+        own buffer-aware reducers under the default protocol."""
+        array = np.arange(2 ** 20, dtype=np.float64).reshape(1024, -1)
+        dataframe = pd.DataFrame({"col1": [1, 2], "col2": [4.0, 5.0]})
+        s3_data_set.save({"array": array, "dataframe": dataframe})
+        reloaded = s3_data_set.load()
+        np.testing.assert_array_equal(reloaded["array"], array)
+        assert_frame_equal(reloaded["dataframe"], dataframe)
+
+    @pytest.mark.usefixtures("mocked_s3_bucket")
+    def test_save_and_load_joblib(self):
+        """Test saving and reloading the data using the joblib backend."""
+        data_set = PickleS3DataSet(
+            filepath=FILENAME,
+            bucket_name=BUCKET_NAME,
+            credentials=AWS_CREDENTIALS,
+            backend="joblib",
+        )
+        array = np.arange(2 ** 20, dtype=np.float64)
+        data_set.save({"array": array})
+        np.testing.assert_array_equal(data_set.load()["array"], array)
+
+    def test_bad_backend(self):
+        """Check the error when trying to instantiate with invalid backend."""
+        pattern = (
+            r"backend should be one of \[\'pickle\'\, \'joblib\'\]\, "
+            r"got wrong\-backend"
+        )
+        with pytest.raises(ValueError, match=pattern):
+            PickleS3DataSet(
+                filepath=FILENAME, bucket_name=BUCKET_NAME, backend="wrong-backend"
+            )
+
+    def test_joblib_not_installed(self, mocker):
+        """Check the error if 'joblib' module is not installed."""
+        mocker.patch("kedro.io.pickle_s3.joblib", None)
+        # creating a pickle-based data set should be fine
+        PickleS3DataSet(filepath=FILENAME, bucket_name=BUCKET_NAME, backend="pickle")
+
+        # creating a joblib-based data set should fail
+        pattern = (
+            r"selected backend \'joblib\' could not be imported\. "
+            r"Make sure it is installed\."
+        )
+        with pytest.raises(ImportError, match=pattern):
+            PickleS3DataSet(
+                filepath=FILENAME, bucket_name=BUCKET_NAME, backend="joblib"
+            )
+
+    def test_joblib_compression(self):
+        """Check the error when trying to compress with the joblib backend."""
+        pattern = (
+            r"compression is only supported by the \'pickle\' backend, "
+            r"got backend joblib"
+        )
+        with pytest.raises(ValueError, match=pattern):
+            PickleS3DataSet(
+                filepath=FILENAME,
+                bucket_name=BUCKET_NAME,
+                compression="zstd",
+                backend="joblib",
+            )
+
+    def test_joblib_fast(self):
+        """Check the error when trying to pickle in fast mode with the joblib
+        backend."""
+        pattern = (
+            r"fast is only supported by the \'pickle\' backend, got backend joblib"
+        )
+        with pytest.raises(ValueError, match=pattern):
+            PickleS3DataSet(
+                filepath=FILENAME,
+                bucket_name=BUCKET_NAME,
+                save_args={"fast": True},
+                backend="joblib",
+            )
+
+    def test_save_default_protocol(self, s3_data_set, mocked_s3_bucket):
+        """Test that protocol 5, or 4 before Python 3.8, is used by default."""
+        s3_data_set.save(DUMMY_PICKABLE_OBJECT)
+        body = mocked_s3_bucket.get_object(Bucket=BUCKET_NAME, Key=FILENAME)[
+            "Body"
+        ].read()
+        assert body[:1] == pickle.PROTO
+        assert body[1] == (5 if sys.version_info >= (3, 8) else 4)
+
+    def test_save_and_load_compressed(self, compressed_s3_data_set, mocked_s3_bucket):
+        """Test saving and reloading a zstd compressed object."""
+        data = [OrderedDict(key=index) for index in range(1000)]
+        compressed_s3_data_set.save(data)
+        body = mocked_s3_bucket.get_object(Bucket=BUCKET_NAME, Key=FILENAME)[
+            "Body"
+        ].read()
+        assert body[:4] == ZSTD_MAGIC_NUMBER
+        assert compressed_s3_data_set.load() == data
+
+    @pytest.mark.usefixtures("mocked_s3_bucket")
+    def test_save_and_load_compression_level(self):
+        """Test that a higher compression level writes a smaller object
+        that still loads back."""
+        data = [OrderedDict(key=index) for index in range(1000)]
+        sizes = {}
+        for compression_level in [1, 19]:
+            data_set = PickleS3DataSet(
+                filepath="level_{}.pkl".format(compression_level),
+                bucket_name=BUCKET_NAME,
+                credentials=AWS_CREDENTIALS,
+                compression="zstd",
+                compression_level=compression_level,
+            )
+            data_set.save(data)
+            assert data_set.load() == data
+            assert "compression_level={}".format(compression_level) in str(data_set)
+            sizes[compression_level] = data_set._s3.size(
+                "{}/level_{}.pkl".format(BUCKET_NAME, compression_level)
+            )
+        assert sizes[19] < sizes[1]
+
+    @pytest.mark.parametrize("compression_level", [0, 23, "high"])
+    def test_bad_compression_level(self, compression_level):
+        """Check the error when trying to instantiate with an invalid
+        compression level."""
+        pattern = r"compression_level should be an integer between 1 and 22"
+        with pytest.raises(ValueError, match=pattern):
+            PickleS3DataSet(
+                filepath=FILENAME,
+                bucket_name=BUCKET_NAME,
+                compression="zstd",
+                compression_level=compression_level,
+            )
+
+    def test_compression_level_without_compression(self):
+        """Test that the compression level is neither validated nor described
+        when the data set is not compressed."""
+        data_set = PickleS3DataSet(
+            filepath=FILENAME, bucket_name=BUCKET_NAME, compression_level=0
+        )
+        assert "compression_level" not in str(data_set)
+
+    def test_bad_compression(self):
+        """Check the error when trying to instantiate with invalid compression."""
+        pattern = r"compression should be one of \[None, \'zstd\'\], got gzip"
+        with pytest.raises(ValueError, match=pattern):
+            PickleS3DataSet(
+                filepath=FILENAME, bucket_name=BUCKET_NAME, compression="gzip"
+            )
+
+    def test_zstandard_not_installed(self, mocker):
+        """Check the error if 'zstandard' module is not installed."""
+        mocker.patch("kedro.io.pickle_s3.zstandard", None)
+        # creating an uncompressed data set should be fine
+        PickleS3DataSet(filepath=FILENAME, bucket_name=BUCKET_NAME)
+
+        # creating a zstd compressed data set should fail
+        pattern = (
+            r"selected compression \'zstd\' requires \'zstandard\' which could "
+            r"not be imported\. Make sure it is installed\."
+        )
+        with pytest.raises(ImportError, match=pattern):
+            PickleS3DataSet(
+                filepath=FILENAME, bucket_name=BUCKET_NAME, compression="zstd"
+            )
+
     def test_serializable(self, s3_data_set):
         ForkingPickler.dumps(s3_data_set)
 